@@ -26,10 +26,12 @@ public class CameraCaptureWebSocket : MonoBehaviour {
     public int jpegQuality = 50; // JPEG quality (1-100)
     public int reconnectDelay = 2; // Seconds between reconnect attempts
     public int heartbeatInterval = 10; // Seconds between heartbeats
+    public bool rawFrames = false; // Send uncompressed BGR24 (6-byte header) instead of JPEG: no encode/decode cost
 
     private Camera cam;
     private RenderTexture rt;
     private Texture2D tex;
+    private byte[] rawBuffer;
     private WebSocket ws;
     //private CancellationTokenSource cts;
     private Coroutine streamCoroutine;
@@ -352,7 +354,29 @@ public class CameraCaptureWebSocket : MonoBehaviour {
         cam.Render();
         tex.ReadPixels(new Rect(0, 0, rt.width, rt.height), 0, 0);
         tex.Apply();
-        return tex.EncodeToJPG(jpegQuality);
+        return rawFrames ? EncodeRawFrame() : tex.EncodeToJPG(jpegQuality);
+    }
+
+    // Wire format: [1B version=1][2B width][2B height][1B format=0 (BGR24)], big-endian,
+    // followed by top-down BGR rows (Unity textures are bottom-up RGB).
+    byte[] EncodeRawFrame() {
+        int w = tex.width, h = tex.height, stride = w * 3;
+        byte[] rgb = tex.GetRawTextureData();
+        if (rawBuffer == null || rawBuffer.Length != 6 + stride * h) rawBuffer = new byte[6 + stride * h];
+        rawBuffer[0] = 1;
+        rawBuffer[1] = (byte)(w >> 8); rawBuffer[2] = (byte)w;
+        rawBuffer[3] = (byte)(h >> 8); rawBuffer[4] = (byte)h;
+        rawBuffer[5] = 0;
+        int o = 6;
+        for (int y = h - 1; y >= 0; y--) {
+            int row = y * stride;
+            for (int x = 0; x < stride; x += 3) {
+                rawBuffer[o++] = rgb[row + x + 2];
+                rawBuffer[o++] = rgb[row + x + 1];
+                rawBuffer[o++] = rgb[row + x];
+            }
+        }
+        return rawBuffer;
     }
 
     private async void CleanupWebSocket() {
@@ -2,10 +2,14 @@
 * RouteSocketServer.cs
 * Responsible for Listening any network get activity
 * Which will be used by our python client to send
-* JSON route to each AUGV
+* JSON route to each AUGV.
+* Messages are one JSON document per line; a client may send
+* a single message and close (route client) or keep the
+* connection open and stream messages (YOLO obstacle feed).
 */
 
 using UnityEngine;
+using System.IO;
 using System.Net;
 using System.Net.Sockets;
 using System.Text;
@@ -39,19 +43,30 @@ public class RouteSocketServer : MonoBehaviour {
     void HandleConnection() {
         try {
             while (true) {
-                using (TcpClient client = listener.AcceptTcpClient())
-                using (NetworkStream stream = client.GetStream()) {
-                    byte[] buffer = new byte[client.ReceiveBufferSize];
-                    int bytesRead = stream.Read(buffer, 0, buffer.Length);
-                    string json = Encoding.UTF8.GetString(buffer, 0, bytesRead);
-                    incomingRoutes.Enqueue(json);
-                }
+                TcpClient client = listener.AcceptTcpClient();
+                Thread clientThread = new Thread(() => HandleClient(client));
+                clientThread.IsBackground = true;
+                clientThread.Start();
             }
             
         } catch (SocketException e) {
             Debug.LogError("[RouteSocketServer] Socket exception: " + e.Message);
         }
     }
+    void HandleClient(TcpClient client) {
+        try {
+            using (client)
+            using (NetworkStream stream = client.GetStream())
+            using (StreamReader reader = new StreamReader(stream, Encoding.UTF8)) {
+                string json;
+                while ((json = reader.ReadLine()) != null) {
+                    if (json.Length > 0) incomingRoutes.Enqueue(json);
+                }
+            }
+        } catch (IOException e) {
+            Debug.LogWarning("[RouteSocketServer] Client connection closed: " + e.Message);
+        }
+    }
 
     void OnApplicationQuit() {
         listener?.Stop();
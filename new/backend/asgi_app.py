@@ -1,7 +1,7 @@
 # asgi_app.py
 # Starlette ASGI app for AUGV YOLO backend: handles agent/monitor websockets, HTTP endpoints, and resource logging.
 
-import os, asyncio, json, logging, psutil, threading, time, numpy as np, cv2, queue, traceback
+import os, asyncio, contextlib, functools, json, logging, psutil, numpy as np, cv2, traceback
 from starlette.applications import Starlette
 from starlette.responses import HTMLResponse, JSONResponse
 from starlette.routing import Route, WebSocketRoute
@@ -94,40 +94,43 @@ def log_monitor_event(msg): logger.info(f"[MONITOR] {msg}")
 #         log_resource_usage()
 
 # HTTP endpoint for /monitor
-async def monitor(request: Request):
-    EXPECTED_AGENTS = [f"AUGV_{i}" for i in range(1, 6)]
-    agents = list(set(agent_frames.keys()) | set(EXPECTED_AGENTS))
-    with open("static/xml/page_monitor.xml", "r", encoding="utf-8") as f:
-        base_template = f.read()
-    agents_monitor = ""
-    for agent in agents:
-        agents_monitor += f'''
+EXPECTED_AGENTS = frozenset(f"AUGV_{i}" for i in range(1, 6))
+
+@functools.lru_cache(maxsize=8)
+def render_monitor(agents):
+    """Monitor page body for a frozenset of agent ids; template read and layout applied once per id set."""
+    base_template = load_page("static/xml/page_monitor.xml")
+    agents_monitor = "".join(f'''
         <div class="col-6 col-md-4 col-lg-3">
             <div class="agent" id="agent-{agent}">
                 <div class="agent-name">{agent}</div>
                 <canvas id="canvas-{agent}" width="640" height="480"></canvas>
             </div>
         </div>
-        '''
+        ''' for agent in sorted(agents))
     content = base_template.replace("<t t-agents/>", agents_monitor)
-    return render_layout("Yolo Monitor", content)
+    return render_layout("Yolo Monitor", content).body
+
+async def monitor(request: Request):
+    agents = EXPECTED_AGENTS if agent_frames.keys() <= EXPECTED_AGENTS else EXPECTED_AGENTS.union(agent_frames)
+    return HTMLResponse(render_monitor(agents))
+
+from .tools.render import render_layout, load_page
 
-from .tools.render import render_layout
+# Static pages: rendered once at import, the same response object is returned on every request
+PAGES = {
+    name: render_layout(title, load_page(f"static/xml/page_{name}.xml"))
+    for name, title in (("home", "Home"), ("map", "Map Editor"), ("404", "Page Not Found"))
+}
 
 async def map(request: Request):
-    with open("static/xml/page_map.xml", "r", encoding="utf-8") as f:
-        template = f.read()
-    return render_layout("Map Editor", template)
+    return PAGES["map"]
 
 async def home(request: Request):
-    with open("static/xml/page_home.xml", "r", encoding="utf-8") as f:
-        content = f.read()
-    return render_layout("Home", content)
+    return PAGES["home"]
 
 async def not_found(request: Request, exc):
-    with open("static/xml/page_404.xml", "r", encoding="utf-8") as f:
-        content = f.read()
-    return render_layout("Page Not Found", content)
+    return PAGES["404"]
 
 from starlette.middleware.errors import ServerErrorMiddleware
 from starlette.exceptions import HTTPException
@@ -152,14 +155,22 @@ routes = [
     Route("/", home, methods=["GET"]),
 ]
 
-app = Starlette(debug=False, routes=routes)
-app.add_exception_handler(404, not_found)
-app.mount("/static", StaticFiles(directory=STATIC_DIR, html=True), name="static")
+RESOURCE_LOG_INTERVAL = 10  # seconds
 
-def log_resources():
+async def log_resources():
+    p = psutil.Process(os.getpid())
     while True:
-        p = psutil.Process(os.getpid())
+        await asyncio.sleep(RESOURCE_LOG_INTERVAL)
         print(f"[RESOURCE] Mem: {p.memory_info().rss/1024/1024:.2f}MB, FDs: {p.num_fds() if hasattr(p, 'num_fds') else 'N/A'}")
-        time.sleep(10)
 
-threading.Thread(target=log_resources, daemon=True).start() 
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    resource_logger = asyncio.create_task(log_resources())
+    try:
+        yield
+    finally:
+        resource_logger.cancel()
+
+app = Starlette(debug=False, routes=routes, lifespan=lifespan)
+app.add_exception_handler(404, not_found)
+app.mount("/static", StaticFiles(directory=STATIC_DIR, html=True), name="static")
@@ -1,9 +1,19 @@
+from functools import lru_cache
 from starlette.responses import HTMLResponse
 
+@lru_cache(maxsize=None)
+def load_page(path):
+    # Static XML pages never change at runtime: read each one once
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+@lru_cache(maxsize=1)
+def _layout_parts():
+    # Pre-split the layout around its two placeholders so rendering is plain concatenation
+    head, rest = load_page("static/xml/web_layout.xml").split("<t t-title/>", 1)
+    mid, tail = rest.split("<t t-out/>", 1)
+    return head, mid, tail
+
 def render_layout(title, template):
-    with open("static/xml/web_layout.xml", "r", encoding="utf-8") as f:
-        web_layout = f.read()
-    return HTMLResponse(
-        web_layout.replace("<t t-title/>", title)
-                  .replace("<t t-out/>", template)
-    )
+    head, mid, tail = _layout_parts()
+    return HTMLResponse(head + title + mid + template + tail)
@@ -43,8 +43,20 @@ ws.onclose = function() {
   const socket = new WebSocket("ws://" + location.host + "/ws/monitor");
   socket.binaryType = "arraybuffer";
 
+  // Each message is one or more [4-byte big-endian length][header JSON '\n' JPEG] segments
   socket.onmessage = (event) => {
-      const data = new Uint8Array(event.data);
+      const view = new DataView(event.data);
+      const bytes = new Uint8Array(event.data);
+      let offset = 0;
+      while (offset + 4 <= bytes.length) {
+          const length = view.getUint32(offset);
+          offset += 4;
+          drawFrame(bytes.subarray(offset, offset + length));
+          offset += length;
+      }
+  };
+
+  function drawFrame(data) {
       const newlineIndex = data.indexOf(10); // '\n'
 
       if (newlineIndex === -1) return;
@@ -109,6 +121,6 @@ ws.onclose = function() {
           }
       };
       img.src = URL.createObjectURL(blob);
-  };
+  }
 })(); 
 
@@ -1,10 +1,22 @@
 # HTTP/webapp/__main__.py
 # Entrypoint for running the ASGI app with uvicorn
+import os
 import uvicorn
 from .asgi_app import app
+try:
+    import uvloop  # Not available on Windows
+except ImportError:
+    uvloop = None
 
 def main():
-    uvicorn.run("webapp.asgi_app:app", host="0.0.0.0", port=8080)
+    # Agent/monitor state lives in module-level dicts, so it is per worker: with WEB_CONCURRENCY > 1
+    # an agent and the monitor watching it must land on the same worker (sticky routing upstream).
+    uvicorn.run(
+        "webapp.asgi_app:app", host="0.0.0.0", port=8080,
+        loop="uvloop" if uvloop else "asyncio", http="httptools", ws="websockets",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        ws_per_message_deflate=False,  # Frames are JPEG or raw pixels: permessage-deflate only costs CPU
+    )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,44 +1,57 @@
 import asyncio
 import threading
+import time
+from collections import deque
 from starlette.websockets import WebSocket
-from typing import Dict, Set, Any
+from typing import Dict, FrozenSet, Any
 
-# In-memory, thread-safe storage for latest agent frames
+AGENT_TTL = 10  # seconds an agent stays listed after its last frame
+
+# In-memory storage for latest agent frames.
+# Single dict stores/loads are atomic under the GIL, so frames need no lock;
+# the client set is copy-on-write so readers get an immutable snapshot.
 class AgentFrameStore:
     def __init__(self):
         self.frames: Dict[str, bytes] = {}
-        self.lock = threading.Lock()
-        self.clients: Set[WebSocket] = set()
+        self.clients: FrozenSet[WebSocket] = frozenset()
+        self.clients_lock = threading.Lock()  # Only serializes client set mutation
         self.agent_last_seen: Dict[str, float] = {}  # For auto-discovery
+        self.seen_log = deque()  # (monotonic ts, agent_id), appended in time order
 
     def set_frame(self, agent_id: str, frame: bytes):
-        with self.lock:
-            self.frames[agent_id] = frame
-            import time
-            self.agent_last_seen[agent_id] = time.time()
+        now = time.monotonic()
+        self.frames[agent_id] = frame
+        self.agent_last_seen[agent_id] = now
+        self.seen_log.append((now, agent_id))
+        self._expire(now)
 
     def get_frame(self, agent_id: str) -> bytes:
-        with self.lock:
-            return self.frames.get(agent_id)
+        return self.frames.get(agent_id)
 
     def get_agents(self):
-        with self.lock:
-            import time
-            now = time.time()
-            # Only return agents seen in the last 10s
-            return [aid for aid, ts in self.agent_last_seen.items() if now - ts < 10]
+        # Only return agents seen in the last AGENT_TTL seconds
+        self._expire(time.monotonic())
+        return list(self.agent_last_seen)
+
+    def _expire(self, now: float):
+        # The log is sorted by time, so only expired entries at the head are touched
+        log = self.seen_log
+        while log and now - log[0][0] >= AGENT_TTL:
+            ts, aid = log.popleft()
+            if self.agent_last_seen.get(aid) == ts:  # No newer frame since this entry
+                self.agent_last_seen.pop(aid, None)
+                self.frames.pop(aid, None)
 
     def register_client(self, ws: WebSocket):
-        with self.lock:
-            self.clients.add(ws)
+        with self.clients_lock:
+            self.clients = self.clients | {ws}
 
     def unregister_client(self, ws: WebSocket):
-        with self.lock:
-            self.clients.discard(ws)
+        with self.clients_lock:
+            self.clients = self.clients - {ws}
 
     def get_clients(self):
-        with self.lock:
-            return list(self.clients)
+        return self.clients
 
 AGENT_FRAMES = AgentFrameStore()
 
@@ -50,12 +63,14 @@ def ws_unity_agent(agent_id: str):
             while True:
                 data = await websocket.receive_bytes()
                 AGENT_FRAMES.set_frame(agent_id, data)
-                # Broadcast to all frontend clients
-                for client in AGENT_FRAMES.get_clients():
-                    try:
-                        await client.send_bytes(data)
-                    except Exception:
-                        pass
+                # Broadcast to all frontend clients concurrently; the same bytes object feeds every send
+                clients = tuple(AGENT_FRAMES.get_clients())
+                if not clients:
+                    continue
+                results = await asyncio.gather(*(c.send_bytes(data) for c in clients), return_exceptions=True)
+                for client, result in zip(clients, results):
+                    if isinstance(result, Exception):
+                        AGENT_FRAMES.unregister_client(client)
         except Exception:
             pass
     return handler
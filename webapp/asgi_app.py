@@ -1,23 +1,31 @@
 # asgi_app.py
 # Starlette ASGI app for AUGV YOLO backend: handles agent/monitor websockets, HTTP endpoints, and resource logging.
 
-import os, asyncio, json, logging, psutil, threading, time, numpy as np, cv2, queue, traceback
+import os, asyncio, contextlib, functools, logging, psutil, struct, numpy as np, cv2, traceback, orjson
 from starlette.applications import Starlette
-from starlette.responses import HTMLResponse, JSONResponse
+from starlette.responses import HTMLResponse, Response
 from starlette.routing import Route, WebSocketRoute
 from starlette.staticfiles import StaticFiles
 from starlette.websockets import WebSocket, WebSocketDisconnect
 from starlette.requests import Request
-from webapp.model.yolo_augv import AgentYoloThread, agent_queues, agent_state
+from websockets.exceptions import ConnectionClosed
+from webapp.model.yolo_augv import AgentYoloThread, agent_queues, agent_state, get_inference_worker
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
 logger = logging.getLogger("asgi_app")
 
 # In-memory state
-agent_frames = {}  # {agent_id: bytes}
+agent_frames = {}  # {agent_id: JPEG bytes or raw BGR ndarray}
 monitor_clients = set()  # Set[WebSocket]
+pending_frames = {}  # {agent_id: JPEG bytes or raw BGR ndarray}, latest frame per agent since the last broadcast
 HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT = 20, 40
+BROADCAST_INTERVAL = 0.05  # seconds; frames within one window go to monitors as a single message
+SEGMENT_LEN = struct.Struct("!I")  # 4-byte big-endian length prefix per segment
+# Raw agent frames: [1B version][2B width][2B height][1B pixel format] + pixels, big-endian
+RAW_FRAME_HEADER = struct.Struct("!BHHB")
+RAW_FRAME_VERSION, RAW_FMT_BGR24 = 1, 0
+MONITOR_JPEG_QUALITY = 70
 
 # Resource usage logging
 log_resource_usage = lambda: logger.info(f"[RESOURCE] Memory: {psutil.Process(os.getpid()).memory_info().rss/1024/1024:.2f} MB, Monitor clients: {len(monitor_clients)}, Agents: {len(agent_frames)}")
@@ -25,47 +33,110 @@ log_resource_usage = lambda: logger.info(f"[RESOURCE] Memory: {psutil.Process(os
 def log_agent_event(agent_id, msg): logger.info(f"[AUGV {agent_id}] {msg}")
 def log_monitor_event(msg): logger.info(f"[MONITOR] {msg}")
 
+# Normal client disconnects: logged by name only, tracebacks are kept for unexpected errors
+DISCONNECT_ERRORS = (WebSocketDisconnect, ConnectionClosed)
+
+def describe_error(exc):
+    if isinstance(exc, DISCONNECT_ERRORS): return type(exc).__name__
+    return f"{exc}\n{''.join(traceback.format_exception(type(exc), exc, exc.__traceback__))}"
+
+def decode_frame(data):
+    """Raw BGR24 frames become a zero-copy view over the received bytes; anything else is decoded as JPEG/PNG."""
+    # JPEG (0xFF) and PNG (0x89) never start with RAW_FRAME_VERSION
+    if len(data) > RAW_FRAME_HEADER.size and data[0] == RAW_FRAME_VERSION:
+        _, width, height, fmt = RAW_FRAME_HEADER.unpack_from(data)
+        if fmt == RAW_FMT_BGR24 and len(data) == RAW_FRAME_HEADER.size + width * height * 3:
+            return np.frombuffer(data, dtype=np.uint8, offset=RAW_FRAME_HEADER.size).reshape((height, width, 3)), False
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR), True
+
+def as_jpeg(frame):
+    """Monitors only understand JPEG: pass encoded frames through, encode raw ones."""
+    if isinstance(frame, (bytes, bytearray)):
+        return frame
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, MONITOR_JPEG_QUALITY])
+    return buf.tobytes() if ok else b""
+
+async def jpeg_frames(frames):
+    """(agent_id, frame) pairs with raw frames JPEG-encoded once, in a worker thread instead of on the event loop."""
+    if all(isinstance(frame, (bytes, bytearray)) for _, frame in frames):
+        return frames
+    encoded = await asyncio.to_thread(lambda: [(agent_id, as_jpeg(frame)) for agent_id, frame in frames])
+    # Monitors connecting later reuse the JPEG instead of encoding the same raw frame again
+    for (agent_id, frame), (_, jpeg) in zip(frames, encoded):
+        if agent_frames.get(agent_id) is frame: agent_frames[agent_id] = jpeg
+    return encoded
+
+def pack_segments(parts):
+    """Pack (header, frame) pairs into one buffer of [4-byte len][header + frame] segments."""
+    buf = bytearray(sum(SEGMENT_LEN.size + len(h) + len(f) for h, f in parts))
+    offset = 0
+    for header, frame in parts:
+        SEGMENT_LEN.pack_into(buf, offset, len(header) + len(frame))
+        offset += SEGMENT_LEN.size
+        buf[offset:offset + len(header)] = header
+        offset += len(header)
+        buf[offset:offset + len(frame)] = frame
+        offset += len(frame)
+    return buf
+
+def monitor_header(agent_id):
+    state = agent_state.get(agent_id, {})
+    return orjson.dumps({
+        "agent_id": agent_id,
+        "detections": state.get("detections", []),
+        "road_outline": state.get("road_outline", [])
+    }, option=orjson.OPT_SERIALIZE_NUMPY) + b'\n'
+
+# Coalesces pending agent frames into one message per BROADCAST_INTERVAL for all monitors
+async def broadcast_loop():
+    while True:
+        await asyncio.sleep(BROADCAST_INTERVAL)
+        if not pending_frames: continue
+        frames = list(pending_frames.items())
+        pending_frames.clear()
+        if not monitor_clients: continue
+        try:
+            # One encode per frame, one payload shared by every monitor
+            frames = await jpeg_frames(frames)
+            payload = pack_segments([(monitor_header(agent_id), jpeg) for agent_id, jpeg in frames])
+        except Exception as e:
+            log_monitor_event(f"failed to pack broadcast: {e}")
+            continue
+        # One snapshot: clients may (dis)connect while the sends are in flight
+        snap = tuple(monitor_clients)
+        results = await asyncio.gather(*(client.send_bytes(payload) for client in snap), return_exceptions=True)
+        failed = [client for client, result in zip(snap, results) if isinstance(result, Exception)]
+        if failed:
+            for result in results:
+                if isinstance(result, Exception): log_monitor_event(f"Client send failed: {describe_error(result)}")
+            monitor_clients.difference_update(failed)
+
 # WebSocket endpoint for Unity agents
 async def augv_ws(websocket: WebSocket):
     agent_id = websocket.path_params["agent_id"]
     await websocket.accept()
     log_agent_event(agent_id, "connected")
     if agent_id not in agent_queues: AgentYoloThread(agent_id).start()
-    AGENT_BROADCAST_INTERVAL, last_sent = 0.2, 0
     try:
         while True:
             data = await websocket.receive_bytes()
-            agent_frames[agent_id] = data
             try:
-                frame_np = np.frombuffer(data, dtype=np.uint8)
-                frame = cv2.imdecode(frame_np, cv2.IMREAD_COLOR)
-                if frame is not None and not agent_queues[agent_id].full():
-                    agent_queues[agent_id].put_nowait(frame)
+                frame, encoded = decode_frame(data)
             except Exception as e:
                 log_agent_event(agent_id, f"frame decode error: {e}")
-            now = time.time()
-            if now >= last_sent:
-                last_sent = now
-                header = json.dumps({
-                    "agent_id": agent_id,
-                    "detections": agent_state.get(agent_id, {}).get("detections", []),
-                    "road_outline": agent_state.get(agent_id, {}).get("road_outline", [])
-                }).encode() + b'\n'
-                payload = header + data
-                send_tasks = [client.send_bytes(payload) for client in list(monitor_clients)]
-                results = await asyncio.gather(*send_tasks, return_exceptions=True)
-                for client, result in zip(list(monitor_clients), results):
-                    if isinstance(result, Exception):
-                        log_monitor_event(f"Client send failed: {result}\n{traceback.format_exc()}")
-                        monitor_clients.discard(client)
-            if len(agent_frames) % 10 == 0: log_resource_usage()
-    except WebSocketDisconnect:
-        log_agent_event(agent_id, "disconnected (WebSocketDisconnect)")
+                continue
+            if frame is None: continue
+            agent_queues[agent_id].put(frame)
+            # Keep JPEG bytes as-is for monitors; raw frames are encoded only when actually broadcast
+            agent_frames[agent_id] = pending_frames[agent_id] = data if encoded else frame
+    except DISCONNECT_ERRORS as e:
+        log_agent_event(agent_id, f"disconnected ({type(e).__name__})")
     except Exception as e:
         log_agent_event(agent_id, f"disconnected (Exception): {e}\n{traceback.format_exc()}")
     finally:
         log_agent_event(agent_id, "connection closed")
         agent_frames.pop(agent_id, None)
+        pending_frames.pop(agent_id, None)
 
 # WebSocket endpoint for frontend monitor
 async def monitor_ws(websocket: WebSocket):
@@ -73,17 +144,19 @@ async def monitor_ws(websocket: WebSocket):
     monitor_clients.add(websocket)
     log_monitor_event(f"client connected (total: {len(monitor_clients)})")
     try:
-        for agent_id, frame in agent_frames.items():
+        if agent_frames:
             try:
-                header = json.dumps({"agent_id": agent_id}).encode() + b'\n'
-                await websocket.send_bytes(header + frame)
-            except WebSocketDisconnect:
-                log_monitor_event("monitor disconnected (WebSocketDisconnect)")
+                frames = await jpeg_frames(list(agent_frames.items()))
+                await websocket.send_bytes(pack_segments(
+                    [(orjson.dumps({"agent_id": agent_id}) + b'\n', jpeg) for agent_id, jpeg in frames]
+                ))
+            except DISCONNECT_ERRORS as e:
+                log_monitor_event(f"monitor disconnected ({type(e).__name__})")
             except Exception as e:
-                log_monitor_event(f"failed to send initial frame for {agent_id}: {e}\n{traceback.format_exc()}")
+                log_monitor_event(f"failed to send initial frames: {e}\n{traceback.format_exc()}")
         while True: await asyncio.sleep(10)
-    except WebSocketDisconnect:
-        log_monitor_event("client disconnected (WebSocketDisconnect)")
+    except DISCONNECT_ERRORS as e:
+        log_monitor_event(f"client disconnected ({type(e).__name__})")
     except Exception as e:
         log_monitor_event(f"client disconnected (Exception): {e}\n{traceback.format_exc()}")
     finally:
@@ -92,10 +165,12 @@ async def monitor_ws(websocket: WebSocket):
         log_resource_usage()
 
 # HTTP endpoint for /monitor
-async def monitor(request: Request):
-    EXPECTED_AGENTS = [f"AUGV_{i}" for i in range(1, 6)]
-    agents = list(set(agent_frames.keys()) | set(EXPECTED_AGENTS))
-    html = """
+EXPECTED_AGENTS = frozenset(f"AUGV_{i}" for i in range(1, 6))
+
+@functools.lru_cache(maxsize=8)
+def render_monitor(agents):
+    """Monitor page for a frozenset of agent ids; memoized since the page only depends on the id set."""
+    parts = ["""
     <html><head>
     <title>YOLO Monitor</title>
     <style>
@@ -107,29 +182,35 @@ async def monitor(request: Request):
     </head><body>
     <h2>YOLO Monitor</h2>
     <div id="agents">
-    """
-    for agent in agents:
-        html += f'''
+    """]
+    for agent in sorted(agents):
+        parts.append(f'''
         <div class="agent" id="agent-{agent}">
             <div class="agent-name">{agent}</div>
             <canvas id="canvas-{agent}" width="640" height="480"></canvas>
         </div>
-        '''
-    html += """
+        ''')
+    parts.append("""
     </div>
     <script src="/static/src/js/monitor.js"></script>
     </body></html>
-    """
-    return HTMLResponse(html)
+    """)
+    return "".join(parts).encode("utf-8")
+
+render_monitor(EXPECTED_AGENTS)  # Pre-build the common case at startup
+
+async def monitor(request: Request):
+    agents = EXPECTED_AGENTS if agent_frames.keys() <= EXPECTED_AGENTS else EXPECTED_AGENTS.union(agent_frames)
+    return HTMLResponse(render_monitor(agents))
 
 # Health check endpoint
 async def health(request: Request):
-    return JSONResponse({
+    return Response(orjson.dumps({
         "status": "ok",
         "agents": list(agent_frames.keys()),
         "monitors": len(monitor_clients),
         "yolo": {agent_id: state for agent_id, state in agent_state.items() if isinstance(state, dict)}
-    })
+    }, option=orjson.OPT_SERIALIZE_NUMPY), media_type="application/json")
 
 STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
 
@@ -140,13 +221,22 @@ routes = [
     Route("/health", health, methods=["GET"]),
 ]
 
-app = Starlette(debug=False, routes=routes)
-app.mount("/static", StaticFiles(directory=STATIC_DIR, html=True), name="static")
+RESOURCE_LOG_INTERVAL = 10  # seconds
 
-def log_resources():
+async def log_resources():
+    p = psutil.Process(os.getpid())
     while True:
-        p = psutil.Process(os.getpid())
+        await asyncio.sleep(RESOURCE_LOG_INTERVAL)
         print(f"[RESOURCE] Mem: {p.memory_info().rss/1024/1024:.2f}MB, FDs: {p.num_fds() if hasattr(p, 'num_fds') else 'N/A'}")
-        time.sleep(10)
 
-threading.Thread(target=log_resources, daemon=True).start() 
\ No newline at end of file
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    get_inference_worker()  # Load the shared YOLO weights in the background before the first agent connects
+    tasks = [asyncio.create_task(broadcast_loop()), asyncio.create_task(log_resources())]
+    try:
+        yield
+    finally:
+        for task in tasks: task.cancel()
+
+app = Starlette(debug=False, routes=routes, lifespan=lifespan)
+app.mount("/static", StaticFiles(directory=STATIC_DIR, html=True), name="static")
@@ -4,18 +4,36 @@
 from werkzeug.wrappers import Response, Request
 from webapp.router import route
 from ..layout import render_layout
+from ..model import yolo_augv
 from ..model.yolo_augv import agent_queues, agent_state, AgentYoloThread
 
-import json, os, time, traceback, threading, base64, numpy as np
+import json, os, re, time, traceback, threading, numpy as np, cv2
 import asyncio
+import orjson
 import websockets
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import uvloop
+except ImportError:  # uvloop has no Windows build
+    uvloop = None
 
 IMAGE_SAVE_DIR = os.path.join(os.getcwd(), "debug_yolo_images")
 os.makedirs(IMAGE_SAVE_DIR, exist_ok=True)
 
+# Serialized agent_state and sorted agent ids, reused until yolo_augv.state_version changes
+_state_json_cache = (0, b"{}")
+_sorted_agents_cache = (0, [])
+
+# Last debug image per agent: { agent_id: (st_mtime_ns, st_size, bytes) }
+_img_cache, _img_cache_lock = {}, threading.Lock()
+IMG_CACHE_MAX = 32
+
+_HOME_BODY = render_layout("web_layout.xml").encode("utf-8")
+
 @route("/home", methods=['GET'])
 def handle_home(request: Request):
-    return Response(render_layout("web_layout.xml"), mimetype="text/html")
+    return Response(_HOME_BODY, mimetype="text/html", headers={"Content-Length": str(len(_HOME_BODY))})
 
 @route("/api/yolo/stream/<agent_id>", methods=['POST'])
 def handle_yolo(request: Request, agent_id: str):
@@ -23,16 +41,14 @@ def handle_yolo(request: Request, agent_id: str):
         AgentYoloThread(agent_id).start()
         #return Response(json.dumps({"error": "unknown agent"}), status=404)
     try:
-        data = request.get_data()
+        # Uncached body, wrapped as a read-only view: the worker copies only the debug frames it saves
+        data = request.get_data(cache=False)
         width = int(request.headers.get("Width", 160))
         height = int(request.headers.get("Height", 160))
 
-        frame = np.frombuffer(data, dtype=np.uint8).reshape((height, width, 3)).copy()
+        frame = np.frombuffer(data, dtype=np.uint8).reshape((height, width, 3))
+        agent_queues[agent_id].put(frame)
 
-        q = agent_queues[agent_id]
-        if not q.full():
-            q.put(frame)
-        
         return Response("OK", status=200)
 
     except Exception as e:
@@ -41,19 +57,39 @@ def handle_yolo(request: Request, agent_id: str):
 
 @route("/api/yolo/check_all", methods=['GET'])
 def handle_check_all(request: Request):
-    return Response(json.dumps(agent_state), mimetype="application/json")
+    global _state_json_cache
+    version = yolo_augv.state_version
+    if _state_json_cache[0] != version:
+        _state_json_cache = (version, orjson.dumps(agent_state, option=orjson.OPT_SERIALIZE_NUMPY))
+    return Response(_state_json_cache[1], mimetype="application/json")
 
 @route("/api/yolo/image/<agent_id>", methods=["GET"])
 def stream_yolo_image(request: Request, agent_id: str):
     path = os.path.join(IMAGE_SAVE_DIR, f"{agent_id}.jpg")
-    if not os.path.exists(path):
+    try:
+        st = os.stat(path)
+    except OSError:
         return Response("Image not found", status=404)
-    with open(path, "rb") as f:
-        return Response(f.read(), content_type="image/jpeg")
-
-@route("/api/yolo/monitor", methods=["GET"])
-def monitor_yolo_all(request: Request):
-    html = """
+    etag = f'W/"{st.st_mtime_ns}-{st.st_size}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status=304, headers=headers)
+
+    cached = _img_cache.get(agent_id)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        data = cached[2]
+    else:
+        with open(path, "rb") as f:
+            data = f.read()
+        # Requests are served on multiple threads: update and evict under one lock
+        with _img_cache_lock:
+            _img_cache.pop(agent_id, None)
+            _img_cache[agent_id] = (st.st_mtime_ns, st.st_size, data)
+            while len(_img_cache) > IMG_CACHE_MAX:
+                _img_cache.pop(next(iter(_img_cache)))
+    return Response(data, content_type="image/jpeg", headers=headers)
+
+MONITOR_HEAD = """
     <html><head>
         <style>
             body { font-family: sans-serif; background: #f9f9f9; padding: 10px; }
@@ -65,57 +101,75 @@ def monitor_yolo_all(request: Request):
         </style>
     </head><body>
     <h2>YOLO Monitor</h2>
-    """
-
-    for agent_id in sorted(agent_state.keys()):
-        info = agent_state[agent_id]
-        status = info.get("status", "unknown")
-        css_class = f"status-{status}"
+    """.encode("utf-8")
+MONITOR_TAIL = b"</body></html>"
 
-        html += f"""
+@route("/api/yolo/monitor", methods=["GET"])
+def monitor_yolo_all(request: Request):
+    global _sorted_agents_cache
+    version = yolo_augv.state_version
+    if _sorted_agents_cache[0] != version:
+        _sorted_agents_cache = (version, sorted(agent_state.keys()))
+    agent_ids = _sorted_agents_cache[1]
+
+    def gen():
+        yield MONITOR_HEAD
+        t = time.time()
+        for agent_id in agent_ids:
+            status = agent_state.get(agent_id, {}).get("status", "unknown")
+            yield f"""
         <div class="agent">
             <div><strong>{agent_id}</strong></div>
-            <div class="{css_class}">{status}</div>
-            <img src="/api/yolo/image/{agent_id}?t={time.time()}">
+            <div class="status-{status}">{status}</div>
+            <img src="/api/yolo/image/{agent_id}?t={t}">
         </div>
-        """
+        """.encode("utf-8")
+        yield MONITOR_TAIL
 
-    html += "</body></html>"
-    return Response(html, mimetype="text/html")
+    return Response(gen(), mimetype="text/html")
 
 connected_agents = {}
 
-def receive_image(agent_id: str, base64_img: str):
+def receive_image(agent_id: str, data: bytes):
     try:
         if agent_id not in agent_queues:
             AgentYoloThread(agent_id).start()
 
-        decoded = base64.b64decode(base64_img)
-        arr = np.frombuffer(decoded, dtype=np.uint8)
+        arr = np.frombuffer(data, dtype=np.uint8)
         img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        if img is None:
+            return
 
-        q = agent_queues[agent_id]
-        if not q.full():
-            q.put(img)
+        agent_queues[agent_id].put(img)
     except Exception as e:
         print(f"[receive_image error] {agent_id}: {e}")
         traceback.print_exc()
 
+WS_PATH_RE = re.compile(r"^/ws/yolo/([A-Za-z0-9_\-]+)$")  # e.g. /ws/yolo/AUGV_1
+
 async def handle_ws(websocket):
+    agent_id = None
     try:
-        path = websocket.path
-        _, _, agent_id = path.strip("/").split("/")  # e.g. /ws/yolo/AUGV_1
+        match = WS_PATH_RE.match(websocket.path)
+        if match is None:
+            print(f"[WebSocket] Rejected path {websocket.path}")
+            await websocket.close(1008, "invalid agent path")
+            return
+        agent_id = match.group(1)
 
         print(f"[WebSocket] Agent {agent_id} connected")
-        AgentYoloThread(agent_id).start()
+        # Reconnects reuse the running worker and its queue
+        if agent_id not in agent_queues:
+            AgentYoloThread(agent_id).start()
         connected_agents[agent_id] = websocket
+        loop = asyncio.get_running_loop()
 
         async for message in websocket:
             try:
-                data = json.loads(message)
-                img_b64 = data.get("image")
-                if img_b64:
-                    receive_image(agent_id, img_b64)
+                # Binary frames carry the encoded image as-is; empty ones are heartbeats
+                if isinstance(message, bytes) and message:
+                    # imdecode releases the GIL; run it off the event loop so other agents keep flowing
+                    await loop.run_in_executor(None, receive_image, agent_id, message)
             except Exception as e:
                 print(f"[WebSocket error] {agent_id}: {e}")
 
@@ -123,16 +177,29 @@ async def handle_ws(websocket):
         print(f"[WebSocket Connection Error] {e}")
 
     finally:
-        if agent_id in connected_agents:
-            del connected_agents[agent_id]
-        print(f"[WebSocket] Agent {agent_id} disconnected")
+        if agent_id is not None:
+            if connected_agents.get(agent_id) is websocket:
+                del connected_agents[agent_id]
+            print(f"[WebSocket] Agent {agent_id} disconnected")
 
 async def start_ws_server():
     print("[WebSocket] Starting on ws://localhost:9999/ws/yolo/<agent_id>")
-    async with websockets.serve(handle_ws, "localhost", 9999):
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=os.cpu_count()))
+    # Frames are already JPEG: permessage-deflate would only burn CPU
+    async with websockets.serve(handle_ws, "localhost", 9999, max_size=2**22, compression=None,
+                                ping_interval=20, ping_timeout=20, write_limit=2**20):
         await asyncio.Future()  # run forever
 
+def _run_ws_server():
+    # Private loop for this thread; uvloop when installed, without touching the process-wide policy
+    loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(start_ws_server())
+    finally:
+        loop.close()
+
 def start_ws_thread_once():
     if not getattr(start_ws_thread_once, "started", False):
         start_ws_thread_once.started = True
-        threading.Thread(target=lambda: asyncio.run(start_ws_server()), daemon=True).start()
+        threading.Thread(target=_run_ws_server, daemon=True).start()
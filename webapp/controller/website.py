@@ -3,12 +3,14 @@ from ..agent_stream import get_active_agents
 from .base import Website, route
 import os
 
+MONITOR_TEMPLATE = os.path.join(os.path.dirname(__file__), '../templates/monitor.xml')
+
 class WebsiteMonitor(Website):
     @route('/monitor', methods=['GET'], group='website')
     async def monitor(self, request):
         agents = get_active_agents()
         html = qweb_render(
-            os.path.join(os.path.dirname(__file__), '../templates/monitor.xml'),
+            MONITOR_TEMPLATE,
             context={'agents': agents}
         )
         return html 
\ No newline at end of file
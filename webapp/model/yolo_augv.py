@@ -1,16 +1,27 @@
 # yolo_augv.py
 # Threaded YOLO detection for each agent. Receives frames, runs YOLO, computes relative (dx, dy) grid offset, sends to Unity.
 
-import threading, queue, os, numpy as np, cv2, base64, math, json, time
+import threading, queue, os, itertools, numpy as np, cv2, base64, math, time, orjson
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from ultralytics import YOLO
 import socket
 
 # Global state for agent communication
-agent_queues, agent_state = {}, {}
+agent_queues, agent_state = {}, {}  # {agent_id: FrameSlot}, {agent_id: state dict}
+state_version, _state_counter = 0, itertools.count(1)  # bumped on every agent_state write
 IMAGE_SAVE_DIR = os.path.join(os.getcwd(), "debug_yolo_images"); os.makedirs(IMAGE_SAVE_DIR, exist_ok=True)
 ALLOWED_CLASSES = {"person"}
 DEBUG = True
-ROAD_LOWER, ROAD_UPPER = np.array([240,40,0]), np.array([255,70,30])
+DEBUG_WRITE_EVERY = 5  # save every Nth frame per agent when DEBUG
+DEBUG_JPEG_QUALITY = 70
+ROAD_LOWER, ROAD_UPPER = np.array([240,40,0], np.uint8), np.array([255,70,30], np.uint8)  # BGR, same dtype as frames
+ROAD_RATIO_MIN = 0.2  # fraction of a bbox covered by road to count as on_road
+ROAD_OUTLINE_WIDTH = 160  # wider road masks are downsampled (aspect kept) before tracing the outline
+OBSTACLE_MAX_DY = 5  # grid rows ahead of the agent that count as blocked
+YOLO_WEIGHTS = "yolo11n-seg.pt"
+MAX_BATCH = 8  # max frames fused into one model.predict call
+BATCH_WINDOW = 0.01  # seconds to wait for other agents' frames after the first one arrives
 
 # Camera parameters (fixed relative to agent)
 CAMERA_HEIGHT = 0.6  # meters
@@ -24,127 +35,262 @@ NODE_CENTER = 0.5  # Center of node in Unity units
 # Unity feedback socket (TCP for reliability)
 UNITY_HOST, UNITY_PORT = "localhost", 8051
 
+_unity_sock, _unity_lock = None, threading.Lock()  # Persistent feedback connection, shared by all agents
+
+def _connect_unity():
+    sock = socket.create_connection((UNITY_HOST, UNITY_PORT), timeout=1.0)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Small messages: don't wait on Nagle
+    return sock
+
 def send_obstacle_data_to_unity(agent_id, blocked_offsets):
-    """Send obstacle data to Unity via TCP connection."""
-    try:
-        # Create a new connection for each message
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as unity_sock:
-            unity_sock.connect((UNITY_HOST, UNITY_PORT))
-            msg = json.dumps({
-                "action": "obstacle",
-                "data": {
-                    "agent_id": agent_id, 
-                    "blocked_offsets": list(blocked_offsets)
-                }
-            })
-            unity_sock.send(msg.encode())
-            print(f"Sent obstacle data to Unity: {msg}")
-    except Exception as e:
-        print(f"Failed to send obstacle data to Unity: {e}")
-
-def image_to_agent_grid_offset(x_img, y_img, img_w, img_h, bbox_h):
-    """Project image pixel (x_img, y_img) to (dx, dy) grid offset relative to agent/camera. Use distance-based bias for dy."""
-    # Convert to normalized device coordinates
-    x_ndc = (x_img / img_w - 0.5) * 2
-    y_ndc = (y_img / img_h - 0.5) * 2
-    # Camera intrinsic
-    fov_rad = math.radians(FOV)
-    aspect = img_w / img_h
-    tan_fov = math.tan(fov_rad / 2)
-    # Ray in camera space
-    x_cam = x_ndc * tan_fov * aspect
-    y_cam = -y_ndc * tan_fov
-    z_cam = 1
+    """Send obstacle data to Unity over a persistent TCP connection, one JSON message per line."""
+    global _unity_sock
+    msg = orjson.dumps({
+        "action": "obstacle",
+        "data": {
+            "agent_id": agent_id,
+            "blocked_offsets": list(blocked_offsets)
+        }
+    }) + b"\n"
+    with _unity_lock:
+        # A dropped connection (Unity restarted, broken pipe) is reopened once and the message resent
+        for attempt in range(2):
+            try:
+                if _unity_sock is None:
+                    _unity_sock = _connect_unity()
+                _unity_sock.sendall(msg)
+                print(f"Sent obstacle data to Unity: {msg.decode().rstrip()}")
+                return
+            except OSError as e:
+                if _unity_sock is not None:
+                    _unity_sock.close()
+                    _unity_sock = None
+                if attempt:
+                    print(f"Failed to send obstacle data to Unity: {e}")
+
+# Projection terms that don't depend on the detection
+_TAN_FOV = math.tan(math.radians(FOV) / 2)
+_COS_RX, _SIN_RX = math.cos(math.radians(CAMERA_ROT_X)), math.sin(math.radians(CAMERA_ROT_X))
+_CAM_Z = NODE_CENTER + CAMERA_FORWARD  # camera at (0, CAMERA_HEIGHT, _CAM_Z) in agent-local space
+# Distance-based dy bias: distance <= 2 -> 0.2, <= 4 -> 0.5, <= 6 -> 0.8, else 1.2
+_BIAS_EDGES = np.array([2.0, 4.0, 6.0])
+_BIAS_VALUES = np.array([0.2, 0.5, 0.8, 1.2])
+
+def image_to_agent_grid_offset_batch(feet_xy, img_w, img_h):
+    """Project (N, 2) image pixels to (dx, dy) grid offsets relative to agent/camera in one pass. Use distance-based bias for dy."""
+    # Normalized device coordinates -> ray in camera space (z_cam = 1)
+    x_cam = (feet_xy[:, 0] / img_w - 0.5) * 2 * _TAN_FOV * (img_w / img_h)
+    y_cam = -(feet_xy[:, 1] / img_h - 0.5) * 2 * _TAN_FOV
     # Rotate by camera tilt (X axis)
-    rot_x = math.radians(CAMERA_ROT_X)
-    y_rot = y_cam * math.cos(rot_x) - z_cam * math.sin(rot_x)
-    z_rot = y_cam * math.sin(rot_x) + z_cam * math.cos(rot_x)
-    # Ray origin in agent-local space (camera at (0, CAMERA_HEIGHT, NODE_CENTER + CAMERA_FORWARD))
-    cam_y = CAMERA_HEIGHT
-    cam_z = NODE_CENTER + CAMERA_FORWARD
+    y_rot = y_cam * _COS_RX - _SIN_RX
+    z_rot = y_cam * _SIN_RX + _COS_RX
     # Intersect with ground plane Y=0
-    t = -cam_y / y_rot if y_rot != 0 else 0
+    t = np.divide(-CAMERA_HEIGHT, y_rot, out=np.zeros_like(y_rot), where=y_rot != 0)
     world_x = x_cam * t
-    world_z = cam_z + z_rot * t
-    
-    # Calculate distance from camera to object
-    distance = math.sqrt(world_x**2 + world_z**2)
-    
-    # Distance-based bias: adjust bias based on how far the object is
-    if distance <= 2.0:
-        # Close objects (1-2 nodes): small bias to avoid overestimation
-        bias = 0.2
-    elif distance <= 4.0:
-        # Medium objects (3-4 nodes): current bias that works well
-        bias = 0.5
-    elif distance <= 6.0:
-        # Far objects (5-6 nodes): larger bias to compensate for perspective
-        bias = 0.8
-    else:
-        # Very far objects (7+ nodes): even larger bias
-        bias = 1.2
-    
-    dy = int(round((world_z + bias) / GRID_SIZE))
-    dx = int(round(world_x / GRID_SIZE))
-    #print(f"feet_pixel: ({x_img:.2f}, {y_img:.2f}), distance: {distance:.2f}, world: ({world_x:.2f}, {world_z:.2f}), bias: {bias:.2f}, offset: ({dx}, {dy})")
+    world_z = _CAM_Z + z_rot * t
+    # Distance-based bias: small for close objects (1-2 nodes), larger to compensate for perspective further out
+    distance = np.hypot(world_x, world_z)
+    bias = _BIAS_VALUES[np.searchsorted(_BIAS_EDGES, distance)]  # side='left' keeps edges inclusive (<=)
+    dy = np.rint((world_z + bias) / GRID_SIZE).astype(np.int64)
+    dx = np.rint(world_x / GRID_SIZE).astype(np.int64)
     return dx, dy
 
+# Debug JPEGs are encoded/written off the inference path; at most 2 writes may be pending
+_DEBUG_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="yolo-debug")
+_DEBUG_PENDING = threading.BoundedSemaphore(2)
+
+def save_debug_image(path, image):
+    """Queue a JPEG write of image on the debug writer, which takes ownership of it; dropped when the writer is backed up."""
+    if not _DEBUG_PENDING.acquire(blocking=False):
+        return
+    future = _DEBUG_EXECUTOR.submit(cv2.imwrite, path, image, [cv2.IMWRITE_JPEG_QUALITY, DEBUG_JPEG_QUALITY])
+    future.add_done_callback(lambda _: _DEBUG_PENDING.release())
+
+def set_agent_state(agent_id, state):
+    """Publish an agent's state and bump state_version so readers can reuse serialized snapshots."""
+    global state_version
+    agent_state[agent_id] = state
+    state_version = next(_state_counter)
+
+class FrameSlot:
+    """Latest-frame-wins handoff to an agent thread: a newer frame replaces one that has not been taken yet."""
+    def __init__(self):
+        self._frames = deque(maxlen=1)  # append/popleft are atomic in CPython, no lock needed
+        self._ready = threading.Event()
+
+    def put(self, frame):
+        self._frames.append(frame)
+        self._ready.set()
+
+    def get(self):
+        while True:
+            self._ready.wait()
+            self._ready.clear()
+            try:
+                return self._frames.popleft()
+            except IndexError:
+                continue  # Frame already taken by the previous get(); wait for the next one
+
+def road_ratios(road_mask, xyxy):
+    """Fraction of road pixels inside each (x1, y1, x2, y2) box, from one integral image of the mask."""
+    xyxy = np.asarray(xyxy, dtype=np.int32).reshape(-1, 4)
+    if not len(xyxy): return np.zeros(0)  # No boxes: skip the integral image
+    h, w = road_mask.shape[:2]
+    ii = cv2.integral(road_mask)
+    x1, x2 = np.clip(xyxy[:, 0], 0, w), np.clip(xyxy[:, 2], 0, w)
+    y1, y2 = np.clip(xyxy[:, 1], 0, h), np.clip(xyxy[:, 3], 0, h)
+    s = ii[y2, x2] - ii[y1, x2] - ii[y2, x1] + ii[y1, x1]
+    area = (x2 - x1) * (y2 - y1)
+    return np.divide(s / 255.0, area, out=np.zeros(len(area)), where=area > 0)
+
+_MODEL, _MODEL_LOCK = None, threading.Lock()
+
+def get_model():
+    """Load the YOLO weights once per process and return the shared instance."""
+    global _MODEL
+    if _MODEL is None:
+        with _MODEL_LOCK:
+            if _MODEL is None:
+                _MODEL = YOLO(YOLO_WEIGHTS)
+    return _MODEL
+
+class InferenceWorker(threading.Thread):
+    """Single thread driving the shared YOLO model: drains frames from all agents and runs them as one batched predict."""
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.q = queue.Queue()  # (frame, reply_queue)
+        self.ready = threading.Event()
+        self.model, self.error = None, None
+
+    def submit(self, frame):
+        """Queue a frame for the next batch and block until its Results come back."""
+        reply = queue.Queue(maxsize=1)
+        self.q.put((frame, reply))
+        result = reply.get()
+        if isinstance(result, Exception): raise result
+        return result
+
+    def run(self):
+        try:
+            self.model = get_model()
+        except Exception as e:
+            self.error = e
+        self.ready.set()
+        while True:
+            batch = [self.q.get()]
+            # Agents stream at similar rates: give their frames a short window to join this batch
+            deadline = time.monotonic() + BATCH_WINDOW
+            while len(batch) < MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                try: batch.append(self.q.get(timeout=remaining) if remaining > 0 else self.q.get_nowait())
+                except queue.Empty: break
+            try:
+                if self.model is None: raise RuntimeError(f"YOLO model unavailable: {self.error}")
+                # A list (not np.stack) so agents may send different frame sizes; ultralytics batches it
+                results = self.model.predict([frame for frame, _ in batch], conf=0.4, verbose=False)
+            except Exception as e:
+                results = [e] * len(batch)
+            for (_, reply), result in zip(batch, results):
+                reply.put(result)
+
+_inference_worker, _inference_lock = None, threading.Lock()
+
+def get_inference_worker():
+    """Start (once) and return the process-wide InferenceWorker."""
+    global _inference_worker
+    with _inference_lock:
+        if _inference_worker is None:
+            _inference_worker = InferenceWorker()
+            _inference_worker.start()
+    return _inference_worker
+
 class AgentYoloThread(threading.Thread):
-    """Thread for each agent: receives frames, runs YOLO, updates state, sends (dx, dy) to Unity."""
+    """Thread for each agent: receives frames, runs them through the shared InferenceWorker, updates state, sends (dx, dy) to Unity."""
     def __init__(self, agent_id):
         super().__init__(daemon=True)
         self.agent_id = agent_id
-        self.q = queue.Queue(maxsize=1)
+        self.q = FrameSlot()
         agent_queues[agent_id] = self.q
-        agent_state[agent_id] = {'status': 'waiting', 'detections': []}
+        set_agent_state(agent_id, {'status': 'waiting', 'detections': []})
         self.last_send_time = 0
         self.last_sent_offsets = set()
+        self.frame_idx = 0
+        self.road_mask = None  # Reused inRange output buffer
 
     def run(self):
-        try:
-            model = YOLO("yolo11n-seg.pt")
-            #print(f"[YOLO] Model loaded for {self.agent_id}: {model.names}")
-        except Exception as e:
-            agent_state[self.agent_id] = {'status': 'error', 'error': str(e)}
+        worker = get_inference_worker()
+        worker.ready.wait()
+        if worker.model is None:
+            set_agent_state(self.agent_id, {'status': 'error', 'error': str(worker.error)})
             return
+        model = worker.model
+        # model.names may be a dict {id: name} or a list
+        names = model.names.items() if isinstance(model.names, dict) else enumerate(model.names)
+        tracked_ids = np.array([k for k, v in names if v in ALLOWED_CLASSES], np.int32)
         while True:
             try:
                 frame = self.q.get()
                 if frame is None: continue
                 print(f"[AUGV {self.agent_id}] Frame received. Shape: {frame.shape}")
                 now = time.time()
-                image = np.ascontiguousarray(frame)
-                img_h, img_w = image.shape[:2]
-                results = model.predict(image, conf=0.4, verbose=False)[0]
-                road_mask = cv2.inRange(image, ROAD_LOWER, ROAD_UPPER)
-                contours, _ = cv2.findContours(road_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                road_outline = []
-                if contours:
-                    largest = max(contours, key=cv2.contourArea)
-                    largest = largest.squeeze() if largest.ndim == 3 else largest
-                    if len(largest.shape) == 2: road_outline = [[int(pt[0]), int(pt[1])] for pt in largest]
+                self.frame_idx += 1
+                # Only frames that are actually saved get annotated; the rest stay untouched (and uncopied)
+                save = DEBUG and self.frame_idx % DEBUG_WRITE_EVERY == 0
+                img_h, img_w = frame.shape[:2]
+                results = worker.submit(frame)
+                # Single fused pass over all three channels, written into the reused mask buffer
+                road_mask = self.road_mask = cv2.inRange(frame, ROAD_LOWER, ROAD_UPPER, dst=self.road_mask)
+                # Saved frames get their own copy to draw on, handed over to the debug writer as-is
+                image = frame.copy() if save else None
+                # Largest road blob by pixel area in one labeling pass, then trace only that blob
+                # The outline is display-only: trace it on a downsampled mask and scale the points back
+                road_outline, contours = [], []
+                scale = min(1.0, ROAD_OUTLINE_WIDTH / road_mask.shape[1])
+                small = road_mask if scale == 1.0 else cv2.resize(road_mask, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+                n, labels, stats, _ = cv2.connectedComponentsWithStats(small, connectivity=8, ltype=cv2.CV_32S)
+                if n > 1:
+                    k = 1 + int(stats[1:, cv2.CC_STAT_AREA].argmax())
+                    contours, _ = cv2.findContours((labels == k).view(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+                    if contours:
+                        outline = (contours[0].reshape(-1, 2) / scale).astype(np.int32)
+                        road_outline, contours = outline.tolist(), [outline.reshape(-1, 1, 2)]
                 detections = []
                 blocked_offsets = set()
-                for box in getattr(results, "boxes", []):
-                    cls_id = int(box.cls[0]); label = model.names[cls_id]
-                    if label != "person": continue
-                    conf = float(box.conf[0]); xywh = box.xywh[0].tolist()
-                    x, y, w, h = xywh
-                    # Bottom center of bbox (feet)
-                    feet_x = x
-                    feet_y = y + h/2
-                    dx, dy = image_to_agent_grid_offset(feet_x, feet_y, img_w, img_h, h)
-                    blocked_offsets.add((dx, dy) if dy > 0 and dy <= 5 else None)
-                    detections.append({"label": label, "confidence": round(conf, 3), "bbox": [round(v,2) for v in xywh], "feet": [feet_x, feet_y], "offset": [dx, dy]})
-                    if DEBUG:
-                        color = (0,0,255)
-                        x1, y1, x2, y2 = map(int, [x-w/2, y-h/2, x+w/2, y+h/2])
-                        cv2.rectangle(image, (x1, y1), (x2, y2), color, 1)
-                        cv2.putText(image, f"{label} {conf:.2f}", (x1, y1-4), cv2.FONT_HERSHEY_SIMPLEX, 0.3, color, 1)
-                        cv2.circle(image, (int(feet_x), int(feet_y)), 3, (255,0,0), -1)
-                if DEBUG:
+                boxes = getattr(results, "boxes", None)
+                if boxes is not None and len(boxes):
+                    # One device->host pull for all boxes instead of per-box tensor indexing
+                    xywh = boxes.xywh.cpu().numpy().astype(np.float64)  # float64 like the scalar math it replaced
+                    confs = boxes.conf.cpu().numpy()
+                    cls_ids = boxes.cls.cpu().numpy().astype(np.int32)
+                    # Drop untracked classes before any per-box work
+                    keep = np.isin(cls_ids, tracked_ids)
+                    xywh, confs, cls_ids = xywh[keep], confs[keep], cls_ids[keep]
+                    xyxy = np.empty_like(xywh)
+                    xyxy[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+                    xyxy[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+                    xyxy = xyxy.astype(np.int32)
+                    on_road = road_ratios(road_mask, xyxy) > ROAD_RATIO_MIN
+                    # Bottom center of bbox (feet), projected for all boxes at once
+                    feet = np.column_stack((xywh[:, 0], xywh[:, 1] + xywh[:, 3] / 2))
+                    dxs, dys = image_to_agent_grid_offset_batch(feet, img_w, img_h)
+                    # Only obstacles ahead and within range block nodes
+                    ahead = (dys > 0) & (dys <= OBSTACLE_MAX_DY)
+                    blocked_offsets = set(zip(dxs[ahead].tolist(), dys[ahead].tolist()))
+                    for i in range(len(cls_ids)):
+                        label = model.names[int(cls_ids[i])]
+                        conf = float(confs[i]); x, y, w, h = xywh[i].tolist()
+                        feet_x, feet_y = feet[i].tolist()
+                        dx, dy = int(dxs[i]), int(dys[i])
+                        detections.append({"label": label, "confidence": round(conf, 3), "bbox": [round(v,2) for v in (x, y, w, h)], "feet": [feet_x, feet_y], "offset": [dx, dy], "on_road": bool(on_road[i])})
+                        if save:
+                            color = (0,0,255)
+                            x1, y1, x2, y2 = xyxy[i].tolist()
+                            cv2.rectangle(image, (x1, y1), (x2, y2), color, 1)
+                            cv2.putText(image, f"{label} {conf:.2f}", (x1, y1-4), cv2.FONT_HERSHEY_SIMPLEX, 0.3, color, 1)
+                            cv2.circle(image, (int(feet_x), int(feet_y)), 3, (255,0,0), -1)
+                if save:
                     cv2.drawContours(image, contours, -1, (0,255,255), 1)
-                    cv2.imwrite(os.path.join(IMAGE_SAVE_DIR, f"{self.agent_id}.jpg"), image)
+                    save_debug_image(os.path.join(IMAGE_SAVE_DIR, f"{self.agent_id}.jpg"), image)
                 # Send (dx, dy) offsets to Unity via TCP
                 if blocked_offsets and (
                     now - self.last_send_time >= 0.5 or
@@ -154,11 +300,11 @@ class AgentYoloThread(threading.Thread):
                     send_obstacle_data_to_unity(self.agent_id, blocked_offsets)
                     self.last_send_time = now
                     self.last_sent_offsets = blocked_offsets.copy()
-                agent_state[self.agent_id] = {
+                set_agent_state(self.agent_id, {
                     'status': 'blocked' if blocked_offsets else 'safe',
                     'detections': detections,
                     'road_outline': road_outline,
                     'blocked_offsets': list(blocked_offsets)
-                }
+                })
             except Exception as e:
-                agent_state[self.agent_id] = {'status': 'error', 'error': str(e)}
\ No newline at end of file
+                set_agent_state(self.agent_id, {'status': 'error', 'error': str(e)})
\ No newline at end of file
@@ -1,9 +1,9 @@
 import os
 import threading
 from xml.etree import ElementTree as ET
-from typing import Any, Dict
+from typing import Any, Callable, Dict
 
-# Thread-safe cache for parsed XML templates
+# Thread-safe cache for compiled XML templates: { path: (mtime_ns, root, render) }
 class TemplateCache:
     def __init__(self):
         self._cache = {}
@@ -22,63 +22,103 @@ TEMPLATE_CACHE = TemplateCache()
 class QWebRenderError(Exception):
     pass
 
-def load_template(path: str) -> ET.Element:
+def _load(path: str):
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        raise QWebRenderError(f"Template not found: {path}")
     cached = TEMPLATE_CACHE.get(path)
-    if cached is not None:
+    if cached is not None and cached[0] == mtime:
         return cached
-    if not os.path.exists(path):
-        raise QWebRenderError(f"Template not found: {path}")
     tree = ET.parse(path)
     root = tree.getroot()
-    TEMPLATE_CACHE.set(path, root)
-    return root
+    entry = (mtime, root, _compile_template(root))
+    TEMPLATE_CACHE.set(path, entry)
+    return entry
+
+def load_template(path: str) -> ET.Element:
+    return _load(path)[1]
 
 def qweb_render(template_path: str, context: Dict[str, Any] = None) -> str:
     context = context or {}
-    root = load_template(template_path)
-    return _render_node(root, context)
-
-def _render_node(node, context):
-    # Handle QWeb-like directives
-    if node.tag == 't-set':
-        name = node.attrib.get('name')
-        value = _eval_expr(node.attrib.get('value', ''), context)
-        context = context.copy()
-        context[name] = value
-        return ''
-    if node.tag == 't-if':
-        expr = node.attrib.get('expr')
-        if _eval_expr(expr, context):
-            return ''.join(_render_node(child, context) for child in node)
-        else:
-            return ''
-    if node.tag == 't-foreach':
-        expr = node.attrib.get('expr')
-        as_ = node.attrib.get('as', 'item')
-        items = _eval_expr(expr, context)
-        out = []
-        for item in items:
-            ctx = context.copy()
-            ctx[as_] = item
-            out.append(''.join(_render_node(child, ctx) for child in node))
-        return ''.join(out)
-    if node.tag == 't-out':
-        expr = node.attrib.get('expr')
-        val = _eval_expr(expr, context)
-        return str(val) if val is not None else ''
-    if node.tag == 't-esc':
-        expr = node.attrib.get('expr')
-        val = _eval_expr(expr, context)
-        return _escape(str(val)) if val is not None else ''
-    # Render normal XML/HTML
-    out = []
-    if node.text:
-        out.append(node.text)
-    for child in node:
-        out.append(_render_node(child, context))
-        if child.tail:
-            out.append(child.tail)
-    return f'<{node.tag}{_render_attrs(node)}>' + ''.join(out) + f'</{node.tag}>'
+    return _load(template_path)[2](context)
+
+# --- Template compiler ---
+# Each template is turned once into Python source for a `_render(ctx0)` function: static markup
+# becomes merged string constants, and every t-* expression is compiled to a code object up front.
+
+class _TemplateCompiler:
+    def __init__(self):
+        self.lines = ["def _render(ctx0):", "    out = []", "    _a = out.append"]
+        self.codes = []  # compiled expressions, referenced as _codes[i]
+        self.static, self.static_indent = [], 1
+
+    def text(self, indent, s):
+        if not s:
+            return
+        if self.static and self.static_indent != indent:
+            self.flush()
+        self.static_indent = indent
+        self.static.append(s)
+
+    def flush(self):
+        if self.static:
+            self.lines.append('    ' * self.static_indent + f"_a({''.join(self.static)!r})")
+            self.static = []
+
+    def line(self, indent, src):
+        self.flush()
+        self.lines.append('    ' * indent + src)
+
+    def expr(self, expr):
+        try:
+            code = compile(expr, '<qweb>', 'eval')
+        except Exception:
+            code = None  # Same as a failing eval at render time: evaluates to ''
+        self.codes.append(code)
+        return f"_codes[{len(self.codes) - 1}]"
+
+    def node(self, node, indent, depth):
+        ctx = f"ctx{depth}"
+        if node.tag == 't-set':
+            # The value is evaluated but, as before, does not leak into sibling nodes
+            self.line(indent, f"_eval({self.expr(node.attrib.get('value', ''))}, {ctx})")
+            return
+        if node.tag == 't-if':
+            self.line(indent, f"if _eval({self.expr(node.attrib.get('expr'))}, {ctx}):")
+            for child in node:
+                self.node(child, indent + 1, depth)
+            self.line(indent + 1, "pass")
+            return
+        if node.tag == 't-foreach':
+            inner = f"ctx{depth + 1}"
+            self.line(indent, f"for _item{depth} in _eval({self.expr(node.attrib.get('expr'))}, {ctx}):")
+            self.line(indent + 1, f"{inner} = {ctx}.copy(); {inner}[{node.attrib.get('as', 'item')!r}] = _item{depth}")
+            for child in node:
+                self.node(child, indent + 1, depth + 1)
+            return
+        if node.tag in ('t-out', 't-esc'):
+            wrap = "_escape(str(_v))" if node.tag == 't-esc' else "str(_v)"
+            self.line(indent, f"_v = _eval({self.expr(node.attrib.get('expr'))}, {ctx})")
+            self.line(indent, f"_a({wrap} if _v is not None else '')")
+            return
+        # Normal XML/HTML
+        self.text(indent, f'<{node.tag}{_render_attrs(node)}>')
+        self.text(indent, node.text)
+        for child in node:
+            self.node(child, indent, depth)
+            self.text(indent, child.tail)
+        self.text(indent, f'</{node.tag}>')
+
+    def build(self, root) -> Callable[[Dict[str, Any]], str]:
+        self.node(root, 1, 0)
+        self.line(1, "return ''.join(out)")
+        namespace = {'_eval': _eval, '_escape': _escape, '_codes': self.codes}
+        exec(compile('\n'.join(self.lines), '<qweb>', 'exec'), namespace)
+        return namespace['_render']
+
+def _compile_template(root) -> Callable[[Dict[str, Any]], str]:
+    return _TemplateCompiler().build(root)
 
 def _render_attrs(node):
     attrs = []
@@ -87,9 +127,13 @@ def _render_attrs(node):
             attrs.append(f' {k}="{_escape(v)}"')
     return ''.join(attrs)
 
-def _eval_expr(expr, context):
+_EVAL_GLOBALS = {}
+
+def _eval(code, context):
+    if code is None:
+        return ''
     try:
-        return eval(expr, {}, context)
+        return eval(code, _EVAL_GLOBALS, context)
     except Exception as e:
         return ''
 
@@ -98,4 +142,4 @@ def _escape(s):
              .replace('<', '&lt;')
              .replace('>', '&gt;')
              .replace('"', '&quot;')
-             .replace("'", '&#39;')) 
\ No newline at end of file
+             .replace("'", '&#39;'))
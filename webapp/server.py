@@ -1,6 +1,9 @@
 from werkzeug.wrappers import Request, Response
 from werkzeug.routing import Map, Rule
-import inspect
+from werkzeug.wsgi import wrap_file
+from werkzeug.http import http_date
+from werkzeug.security import safe_join
+import inspect, mimetypes, os
 
 from werkzeug.serving import run_simple
 from .layout import render_layout
@@ -13,6 +16,7 @@ class Application:
     def __init__(self):
         self.url_map = Map()
         self.handlers = {}
+        self.takes_request = {}  # endpoint -> whether the handler accepts a `request` argument
     
     def __call__(self, environ, start_response):
         response = self.dispatch(environ)
@@ -22,6 +26,8 @@ class Application:
         rule = Rule(path, endpoint=endpoint.__name__, methods=methods)
         self.url_map.add(rule)
         self.handlers[endpoint.__name__] = endpoint
+        # Inspect once at registration; inspect.signature is too slow for the per-request path
+        self.takes_request[endpoint.__name__] = 'request' in inspect.signature(endpoint).parameters
     
     def dispatch(self, environ):
         request = Request(environ)
@@ -29,7 +35,7 @@ class Application:
         try:
             endpoint, values = adapter.match()
             handler = self.handlers[endpoint]
-            if 'request' in inspect.signature(handler).parameters:
+            if self.takes_request[endpoint]:
                 response = handler(request=request, **values)
             else:
                 response = handler(**values)
@@ -41,41 +47,62 @@ class Application:
 
 
 
-def load_static_file(filename):
-    path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', filename)
-    if not os.path.exists(path):
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static')
+def load_static_file(environ, filename):
+    # Stream through the server's file_wrapper so it can use sendfile(2) instead of copying into Python
+    path = safe_join(STATIC_DIR, filename)
+    if path is None or not os.path.isfile(path):
         return Response('File not found', status=404)
-    with open(path, 'rb') as f:
-        content = f.read()
-    return Response(content, mimetype='text/html')
+    f = open(path, 'rb')
+    st = os.fstat(f.fileno())
+    # Assets aren't fingerprinted: browsers revalidate every time and get a 304 while the file is unchanged
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    headers = {'ETag': etag, 'Last-Modified': http_date(st.st_mtime), 'Cache-Control': 'no-cache'}
+    if environ.get('HTTP_IF_NONE_MATCH') == etag:
+        f.close()
+        return Response(status=304, headers=headers)
+    headers['Content-Length'] = str(st.st_size)
+    return Response(
+        wrap_file(environ, f),
+        mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream',
+        direct_passthrough=True,
+        headers=headers,
+    )
 
-def create_app():
-    url_map = Map([
-        Rule('/', endpoint='index'),
-        Rule('/static/<path:filename>', endpoint='static'),
-        Rule('/api/state', endpoint='state'),
-    ])
+# index.xml is static: render it once instead of per request
+_INDEX_BODY = render_layout('index.xml').encode('utf-8')
 
+def create_app():
+    # Three fixed endpoints: match PATH_INFO directly instead of binding a werkzeug Map per request
     def app(environ, start_response):
-        request = Request(environ)
-        adapter = url_map.bind_to_environ(environ)
         try:
-            endpoint, values = adapter.match()
-            if endpoint == 'index':
-                body = render_layout('index.xml')
-                return Response(body, mimetype='text/html')(environ, start_response)
-            elif endpoint == 'static':
-                return load_static_file(values['filename'])(environ, start_response)
-            elif endpoint == 'state':
+            if environ.get('REQUEST_METHOD') not in ('GET', 'HEAD'):
+                return Response('Method Not Allowed', status=405)(environ, start_response)
+            path = environ.get('PATH_INFO') or '/'
+            if path == '/':
+                return Response(_INDEX_BODY, mimetype='text/html',
+                                headers={'Content-Length': str(len(_INDEX_BODY))})(environ, start_response)
+            elif path == '/api/state':
                 from .routes.state import handle_state
                 return handle_state()(environ, start_response)
+            elif path.startswith('/static/') and len(path) > len('/static/'):
+                return load_static_file(environ, path[len('/static/'):])(environ, start_response)
+            return Response('Not Found', status=404)(environ, start_response)
         except Exception as e:
             return Response(f"Error: {e}", status=500)(environ, start_response)
 
     return app
 
-def run_server():
+def make_wsgi_app():
     app = Application()
     register_all_routes(app)
-    print("Serving on http://localhost:8080")
-    run_simple('localhost', 8080, app, threaded=True)
+    return app
+
+def run_server(host='localhost', port=8080):
+    # Development server only (thread per request). For production use a pooled keep-alive server:
+    #   gunicorn -w 1 -k gthread --threads 16 --keep-alive 60 'webapp.server:make_wsgi_app()'
+    # Agent queues/state, the agent threads and the YOLO model are per process, so keep a single worker
+    # (scale with --threads); gevent would turn those threads into greenlets blocked by model.predict.
+    app = make_wsgi_app()
+    print(f"Serving on http://{host}:{port}")
+    run_simple(host, port, app, threaded=True)
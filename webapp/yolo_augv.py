@@ -19,6 +19,16 @@ os.makedirs(IMAGE_SAVE_DIR, exist_ok=True)
 ALLOWED_CLASSES = {"person", "obstacle"}
 DEBUG = False  # Set to True to save .jpg debug images
 
+# One model shared by all agent threads; predict is not guaranteed thread-safe, so calls are serialized
+_MODEL, _MODEL_LOCK = None, threading.Lock()
+
+def get_model():
+    global _MODEL
+    with _MODEL_LOCK:
+        if _MODEL is None:
+            _MODEL = YOLO("yolov8n-seg.pt")
+    return _MODEL
+
 class AgentYoloThread(threading.Thread):
     def __init__(self, agent_id):
         super().__init__(daemon=True)
@@ -29,7 +39,7 @@ class AgentYoloThread(threading.Thread):
     
     def run(self):
         try:
-            model = YOLO("yolov8n-seg.pt")
+            model = get_model()
         except Exception as e:
             agent_state[self.agent_id] = {'status': 'error', 'error': str(e)}
             return
@@ -41,7 +51,8 @@ class AgentYoloThread(threading.Thread):
                     continue
 
                 image = np.ascontiguousarray(frame)
-                results = model.predict(image, verbose=False)[0]
+                with _MODEL_LOCK:
+                    results = model.predict(image, verbose=False)[0]
 
                 detections = []
                 for box in getattr(results, "boxes", []):